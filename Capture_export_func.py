@@ -0,0 +1,148 @@
+import gzip
+import os
+import re
+
+import open3d as o3d
+import numpy as np
+
+"""
+Export of the captured point clouds and reconstructed meshes.
+Geometries are written in chunks straight from the open3d buffers, so that a large mesh
+is never copied in full before it reaches the disk. Every file gets an auto-numbered name,
+so that a continuous capture session never overwrites earlier output.
+"""
+
+# Format name (as shown in the UI) -> file extension
+EXPORT_FORMATS = {
+    "Binary PLY": ".ply",
+    "Compressed PLY": ".ply.gz",
+    "GLB": ".glb",
+    "NumPy arrays": ".npz",
+}
+
+# Formats that can only hold meshes, point clouds are written as binary PLY instead
+MESH_ONLY_FORMATS = ("GLB",)
+
+# Number of vertices / faces written per chunk
+CHUNK_SIZE = 1 << 16
+
+
+def next_numbered_path(directory, prefix, extension):
+    """
+    Reserve the next free file name <prefix>_<number><extension> in the directory.
+    The file is created empty, so that exports queued one after another never get the same name.
+    """
+    os.makedirs(directory, exist_ok=True)
+    pattern = re.compile(r"^{}_(\d+){}$".format(re.escape(prefix), re.escape(extension)))
+    numbers = [int(m.group(1)) for m in map(pattern.match, os.listdir(directory)) if m]
+    number = max(numbers, default=0) + 1
+    while True:
+        path = os.path.join(directory, "{}_{:04d}{}".format(prefix, number, extension))
+        try:
+            with open(path, "x"):
+                return path
+        except FileExistsError:
+            number += 1
+
+
+def _ply_vertex_dtype(has_normals, has_colors):
+    fields = [("x", "<f4"), ("y", "<f4"), ("z", "<f4")]
+    if has_normals:
+        fields += [("nx", "<f4"), ("ny", "<f4"), ("nz", "<f4")]
+    if has_colors:
+        fields += [("red", "u1"), ("green", "u1"), ("blue", "u1")]
+    return np.dtype(fields)
+
+
+def _ply_header(vertex_dtype, n_vertices, n_faces):
+    types = {"<f4": "float", "u1": "uchar"}
+    lines = ["ply", "format binary_little_endian 1.0", "comment written by Surface_reconstruction",
+             "element vertex {}".format(n_vertices)]
+    lines += ["property {} {}".format(types[vertex_dtype[name].str.replace("|", "")], name)
+              for name in vertex_dtype.names]
+    if n_faces:
+        lines += ["element face {}".format(n_faces), "property list uchar int vertex_indices"]
+    lines.append("end_header")
+    return ("\n".join(lines) + "\n").encode("ascii")
+
+
+def write_ply_chunked(path, points, normals=None, colors=None, triangles=None, compressed=False):
+    """
+    Write a binary little endian PLY file, CHUNK_SIZE rows at a time.
+    Only one chunk is converted to the PLY record layout at a time, the source arrays are read as they are.
+    """
+    has_normals = normals is not None and len(normals) == len(points)
+    has_colors = colors is not None and len(colors) == len(points)
+    n_faces = 0 if triangles is None else len(triangles)
+    vertex_dtype = _ply_vertex_dtype(has_normals, has_colors)
+    face_dtype = np.dtype([("n", "u1"), ("v", "<i4", (3,))])
+
+    opener = gzip.open if compressed else open
+    with opener(path, "wb") as f:
+        f.write(_ply_header(vertex_dtype, len(points), n_faces))
+        for start in range(0, len(points), CHUNK_SIZE):
+            stop = min(start + CHUNK_SIZE, len(points))
+            chunk = np.empty(stop - start, dtype=vertex_dtype)
+            chunk["x"], chunk["y"], chunk["z"] = points[start:stop].T
+            if has_normals:
+                chunk["nx"], chunk["ny"], chunk["nz"] = normals[start:stop].T
+            if has_colors:
+                rgb = np.clip(colors[start:stop] * 255.0 + 0.5, 0, 255).astype(np.uint8)
+                chunk["red"], chunk["green"], chunk["blue"] = rgb.T
+            f.write(chunk.tobytes())
+        for start in range(0, n_faces, CHUNK_SIZE):
+            stop = min(start + CHUNK_SIZE, n_faces)
+            chunk = np.empty(stop - start, dtype=face_dtype)
+            chunk["n"] = 3
+            chunk["v"] = triangles[start:stop]
+            f.write(chunk.tobytes())
+    return path
+
+
+def _geometry_arrays(geometry):
+    """Numpy views (no copies) of the buffers of a point cloud or triangle mesh"""
+    if isinstance(geometry, o3d.geometry.TriangleMesh):
+        return {"points": np.asarray(geometry.vertices),
+                "normals": np.asarray(geometry.vertex_normals),
+                "colors": np.asarray(geometry.vertex_colors),
+                "triangles": np.asarray(geometry.triangles)}
+    return {"points": np.asarray(geometry.points),
+            "normals": np.asarray(geometry.normals),
+            "colors": np.asarray(geometry.colors)}
+
+
+def export_geometry(geometry, path, export_format):
+    """Write a point cloud or a triangle mesh to path in one of the EXPORT_FORMATS"""
+    arrays = _geometry_arrays(geometry)
+    if export_format == "Binary PLY":
+        write_ply_chunked(path, **arrays)
+    elif export_format == "Compressed PLY":
+        write_ply_chunked(path, compressed=True, **arrays)
+    elif export_format == "NumPy arrays":
+        np.savez(path, **{name: array for name, array in arrays.items() if len(array)})
+    elif export_format == "GLB":
+        if "triangles" not in arrays:
+            raise ValueError("GLB export is only supported for meshes")
+        if not o3d.io.write_triangle_mesh(path, geometry):
+            raise IOError("Could not write {}".format(path))
+    else:
+        raise ValueError("Unknown export format: {}".format(export_format))
+    return path
+
+
+def export_numbered(geometry, directory, prefix, export_format):
+    """
+    Export the geometry to the next auto-numbered file in the directory and return its path.
+    Point clouds are written as binary PLY when the format only supports meshes.
+    The reserved file is removed again if the export fails.
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError("Unknown export format: {}".format(export_format))
+    if export_format in MESH_ONLY_FORMATS and not isinstance(geometry, o3d.geometry.TriangleMesh):
+        export_format = "Binary PLY"
+    path = next_numbered_path(directory, prefix, EXPORT_FORMATS[export_format])
+    try:
+        return export_geometry(geometry, path, export_format)
+    except BaseException:
+        os.remove(path)
+        raise
@@ -1,10 +1,10 @@
-import open3d as o3d
 import open3d.visualization.gui as gui
 import open3d.visualization.rendering as rendering
 import numpy as np
-from Capture_reconstruct_func import reconstrct_aplha_shapes, reconstrct_poisson_surface, reconstruct_ball_pivoting, \
-    get_scene_pcd_from_camera, remove_statistical_outlier, remove_radius_outlier, crop_func, zoom_image, \
-    down_sample_uniform, crop_function2
+from Capture_reconstruct_func import get_scene_pcd_from_camera, remove_statistical_outlier, remove_radius_outlier, \
+    crop_func, zoom_image, down_sample_uniform, crop_function2, compute_cloud_statistics, suggest_parameters
+from Capture_export_func import EXPORT_FORMATS, export_numbered
+from Capture_reconstruct_worker import run_reconstruction, ReconstructionError
 from apscheduler.schedulers.background import BackgroundScheduler
 
 """
@@ -33,6 +33,12 @@ class Settings:
         self.show_scene_panel = True
         self.auto_update = False
 
+        # Parameters for exporting point clouds and meshes
+        self.export_format = "Binary PLY"
+        self.mesh_export_dir = "Camera_images_ply"
+        self.pcd_export_dir = "output_pcd"
+        self.record_session = False
+
         '''Surface reconstruction default parameters 
         http://www.open3d.org/docs/latest/tutorial/Advanced/surface_reconstruction.html '''
 
@@ -50,6 +56,10 @@ class Settings:
         self.linear_fit = False
         self.n_threads = - 1
 
+        # Limits of the reconstruction worker process
+        self.timeout = 120
+        self.memory_limit_mb = 4096
+
 
 class CaptureScene:
     """
@@ -65,6 +75,10 @@ class CaptureScene:
         self.job = None
         self.mesh = None
         self.pcd = None
+        self.recon_running = False
+        # Cached statistics of a point cloud and the point cloud they belong to
+        self.cloud_stats = None
+        self.cloud_stats_pcd = None
         self.settings = Settings()
 
         # Create UI window
@@ -101,6 +115,12 @@ class CaptureScene:
         self._add_scene_panel.add_fixed(separation_height)
         self._add_scene_panel.add_child(self._update_scene)
 
+        # Button to set the filter and reconstruction parameters from the statistics of the point cloud
+        self._estimate_parameters_button = gui.Button("Estimate parameters from point cloud")
+        self._estimate_parameters_button.set_on_clicked(self._on_button_estimate_parameters)
+        self._add_scene_panel.add_fixed(separation_height)
+        self._add_scene_panel.add_child(self._estimate_parameters_button)
+
         mouse_ctrls = gui.CollapsableVert("Mouse controls", 0.25 * em,
                                           gui.Margins(em, 0, 0, 0))
         mouse_ctrls.set_is_open(False)
@@ -179,6 +199,26 @@ class CaptureScene:
         self._add_scene_panel.add_fixed(separation_height)
         self._add_scene_panel.add_child(downsampling_ctrls)
 
+        # ===================================================================================
+        # ===================================================================================
+        # Add collapsable menu for the export format and recording of the capture session
+        export_ctrls = gui.CollapsableVert("Export controls", 0,
+                                           gui.Margins(em, 0, 0, 0))
+        export_ctrls.set_is_open(False)
+        self._export_format = gui.Combobox()
+        for export_format in EXPORT_FORMATS:
+            self._export_format.add_item(export_format)
+        self._export_format.set_on_selection_changed(self._on_export_format)
+        export_ctrls.add_child(gui.Label("Export format"))
+        export_ctrls.add_child(self._export_format)
+        export_ctrls.add_fixed(separation_height)
+
+        self._record_session = gui.Checkbox("Record every capture and mesh")
+        self._record_session.set_on_checked(self._on_record_session)
+        export_ctrls.add_child(self._record_session)
+        self._add_scene_panel.add_fixed(separation_height)
+        self._add_scene_panel.add_child(export_ctrls)
+
         # ===================================================================================
         # ===================================================================================
         # ===================================================================================
@@ -283,6 +323,29 @@ class CaptureScene:
         # Add the collapsable menu as a child to the srfc_recnstrctn_ctrls
         self._surface_recon_panel.add_fixed(separation_height)
         self._surface_recon_panel.add_child(poisson_surface)
+
+        # ===================================================================================
+        # ===================================================================================
+        # Add collapsable menu for the limits of the reconstruction worker process
+        worker_limits = gui.CollapsableVert("Reconstruction limits", 0,
+                                            gui.Margins(em, 0, 0, 0))
+        worker_limits.set_is_open(False)
+        self._timeout_value = gui.NumberEdit(gui.NumberEdit.INT)
+        self._timeout_value.set_limits(1, 3600)
+        self._timeout_value.set_on_value_changed(self._on_timeout_value)
+        worker_limits.add_child(gui.Label("Timeout (s)"))
+        worker_limits.add_child(self._timeout_value)
+        worker_limits.add_fixed(separation_height)
+
+        self._memory_limit_value = gui.NumberEdit(gui.NumberEdit.INT)
+        self._memory_limit_value.set_limits(256, 65536)
+        self._memory_limit_value.set_on_value_changed(self._on_memory_limit_value)
+        worker_limits.add_child(gui.Label("Memory limit (MB)"))
+        worker_limits.add_child(self._memory_limit_value)
+        worker_limits.add_fixed(separation_height)
+
+        self._surface_recon_panel.add_fixed(separation_height)
+        self._surface_recon_panel.add_child(worker_limits)
         # ---------------------------------------------------------------------------------------
         # ----------------------------------------------------------------------------------------
         # ========================================================================================
@@ -392,6 +455,22 @@ class CaptureScene:
         self.settings.linear_fit = value
         self.apply_settings()
 
+    def _on_timeout_value(self, value):
+        self.settings.timeout = int(value)
+        self.apply_settings()
+
+    def _on_memory_limit_value(self, value):
+        self.settings.memory_limit_mb = int(value)
+        self.apply_settings()
+
+    def _on_export_format(self, name, index):
+        self.settings.export_format = name
+        self.apply_settings()
+
+    def _on_record_session(self, record):
+        self.settings.record_session = record
+        self.apply_settings()
+
     def _on_n_threads(self, value):
         # todo: something wrong if you try to change in it in UI
         self.settings.n_threads = value
@@ -423,6 +502,10 @@ class CaptureScene:
         self._scale_value.double_value = self.settings.scale
         self._linear_fit.checked = self.settings.linear_fit
         self._n_threads.int_value = self.settings.n_threads
+        self._timeout_value.int_value = self.settings.timeout
+        self._memory_limit_value.int_value = self.settings.memory_limit_mb
+        self._export_format.selected_text = self.settings.export_format
+        self._record_session.checked = self.settings.record_session
         self._add_scene_panel.visible = self.settings.show_scene_panel
         self._surface_recon_panel.visible = self.settings.show_recon_panel
         self.auto_update(self.settings.auto_update)
@@ -441,6 +524,24 @@ class CaptureScene:
             bbox = zoom_image(self.pcd)
             self.scene.setup_camera(60, bbox, [0, 0, 0])
         self.scene.scene.add_geometry("3D Scene", self.pcd, mat)
+        if self.settings.record_session:
+            self._export_pcd()
+
+    def _on_button_estimate_parameters(self):
+        if self.pcd is None or not self.pcd.has_points():
+            return
+        # The statistics are computed only once per point cloud
+        if self.cloud_stats_pcd is not self.pcd:
+            self.cloud_stats = compute_cloud_statistics(self.pcd, self.settings.nb_points)
+            self.cloud_stats_pcd = self.pcd
+            print('Point cloud statistics:', self.cloud_stats)
+        suggested = suggest_parameters(self.cloud_stats, self.settings.scale)
+        print('Suggested parameters:', suggested)
+        if self.settings.width != 0:
+            print('Poisson width is set, the suggested depth is ignored by the reconstruction')
+        for name, value in suggested.items():
+            setattr(self.settings, name, value)
+        self.apply_settings()
 
     def _on_show_axes(self, show):
         self.settings.show_axes = show
@@ -471,9 +572,29 @@ class CaptureScene:
         self.scene.scene.clear_geometry()
         self.scene.scene.add_geometry("3D Scene", self.pcd, mat)
 
+    def _export_in_background(self, geometry, directory, prefix):
+        """Write the geometry to the next numbered file on a scheduler thread, so the UI is not blocked"""
+        export_format = self.settings.export_format
+
+        def export():
+            try:
+                path = export_numbered(geometry, directory, prefix, export_format)
+                print('Saved', path)
+            except (IOError, ValueError) as e:
+                print('Export failed:', e)
+
+        # Never drop a queued export, however long it waits for a free scheduler thread
+        self.sched.add_job(export, misfire_grace_time=None)
+
+    def _export_mesh(self):
+        self._export_in_background(self.mesh, self.settings.mesh_export_dir, "output_mesh")
+
+    def _export_pcd(self):
+        self._export_in_background(self.pcd, self.settings.pcd_export_dir, "output_pcd")
+
     def _on_menu_save_mesh(self):
         if self.mesh is not None:
-            o3d.io.write_triangle_mesh("Camera_images_ply/output_mesh.ply", self.mesh)
+            self._export_mesh()
         else:
             pass
 
@@ -491,36 +612,76 @@ class CaptureScene:
 
     def _on_menu_save_pcd(self):
         if self.pcd is not None:
-            o3d.io.write_point_cloud("output_pcd/output_pcd.pcd", self.pcd)
+            self._export_pcd()
         else:
             pass
 
     def _on_menu_quit(self):
         gui.Application.instance.quit()
 
-    def _on_button_alpha_rconstrctn(self):
-        mesh = reconstrct_aplha_shapes(self.pcd, self.settings.alpha)
+    def _reconstruct_in_background(self, method, params, on_done):
+        """
+        Run the reconstruction in the worker process from a scheduler thread, so the UI is not blocked.
+        on_done is called on the main thread with the result; failures are reported in a message box.
+        """
+        if self.pcd is None:
+            return
+        if self.recon_running:
+            print('A reconstruction is already running')
+            return
+        self.recon_running = True
+        pcd = self.pcd
+
+        def reconstruct():
+            try:
+                result = run_reconstruction(method, pcd, params, self.settings.timeout,
+                                            self.settings.memory_limit_mb)
+            except Exception as e:
+                # Any failure has to reach the main thread, otherwise recon_running is never reset
+                message = str(e) if isinstance(e, ReconstructionError) else "{}: {}".format(type(e).__name__, e)
+                print(message)
+                gui.Application.instance.post_to_main_thread(
+                    self.window, lambda: self._on_reconstruction_failed(message))
+            else:
+                gui.Application.instance.post_to_main_thread(
+                    self.window, lambda: self._on_reconstruction_done(on_done, result))
+
+        # A dropped job would leave recon_running set for good
+        self.sched.add_job(reconstruct, misfire_grace_time=None)
+
+    def _on_reconstruction_failed(self, message):
+        self.recon_running = False
+        self.window.show_message_box("Reconstruction failed", message)
+
+    def _on_reconstruction_done(self, on_done, result):
+        self.recon_running = False
+        on_done(result)
+
+    def _show_mesh(self, mesh):
         mat = rendering.MaterialRecord()
         self.scene.scene.clear_geometry()
         self.scene.scene.add_geometry("3D Scene", mesh, mat)
         self.mesh = mesh
+        if self.settings.record_session:
+            self._export_mesh()
+
+    def _on_button_alpha_rconstrctn(self):
+        self._reconstruct_in_background("alpha_shapes", {"alpha": self.settings.alpha}, self._show_mesh)
 
     def _on_button_ball_pivoting(self):
-        mat = rendering.MaterialRecord()
-        radii, mesh = reconstruct_ball_pivoting(self.pcd, self.settings.factor)
+        self._reconstruct_in_background("ball_pivoting", {"factor": self.settings.factor},
+                                        self._on_ball_pivoting_done)
+
+    def _on_ball_pivoting_done(self, result):
+        radii, mesh = result
         self.settings.radii = radii
         self.apply_settings()
-        self.scene.scene.clear_geometry()
-        self.scene.scene.add_geometry("3D Scene", mesh, mat)
-        self.mesh = mesh
+        self._show_mesh(mesh)
 
     def _on_poisson_surface_button(self):
-        mesh = reconstrct_poisson_surface(self.pcd, self.settings.depth, self.settings.width, self.settings.scale,
-                                          self.settings.linear_fit, self.settings.n_threads)
-        mat = rendering.MaterialRecord()
-        self.scene.scene.clear_geometry()
-        self.scene.scene.add_geometry("3D Scene", mesh, mat)
-        self.mesh = mesh
+        params = {"depth": self.settings.depth, "width": self.settings.width, "scale": self.settings.scale,
+                  "linear_fit": self.settings.linear_fit, "n_threads": self.settings.n_threads}
+        self._reconstruct_in_background("poisson_surface", params, self._show_mesh)
 
 
 def main():
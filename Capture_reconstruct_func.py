@@ -64,6 +64,75 @@ def reconstruct_ball_pivoting(pcd, factor):
     return radii, mesh
 
 
+# Number of point spacings spanned by a leaf of the Poisson octree at the suggested depth
+POISSON_LEAF_SPACINGS = 4
+
+
+def _finite_or_nan(values, func):
+    """func applied to the finite values, NaN if there are none"""
+    values = np.asarray(values, dtype=float)
+    values = values[np.isfinite(values)]
+    return float(func(values)) if len(values) else np.nan
+
+
+def _is_positive(value):
+    return bool(np.isfinite(value) and value > 0)
+
+
+def compute_cloud_statistics(pcd, nb_points, sample_size=2000):
+    """
+    Spacing, neighbourhood and extent statistics of the point cloud, computed once on a random sample of points.
+    The neighbours of the sampled points are searched in the full cloud.
+    Statistics that cannot be computed (e.g. too few points) are NaN.
+    """
+    points = np.asarray(pcd.points)
+    sample = np.random.default_rng(0).choice(len(points), min(sample_size, len(points)), replace=False)
+    tree = o3d.geometry.KDTreeFlann(pcd)
+    distances = np.full((len(sample), nb_points), np.nan)
+    for row, index in enumerate(sample):
+        k, _, dist2 = tree.search_knn_vector_3d(points[index], nb_points + 1)
+        # The first neighbour is the point itself
+        distances[row, :k - 1] = np.sqrt(np.asarray(dist2)[1:])
+    spacing = _finite_or_nan(distances[:, 0], np.median)
+    neighbours = np.nan
+    if _is_positive(spacing):
+        neighbours = np.median([tree.search_radius_vector_3d(points[index], 3 * spacing)[0] - 1
+                                for index in sample])
+    extent = pcd.get_axis_aligned_bounding_box().get_extent()
+    return {"n_points": len(points),
+            "spacing_median": spacing,
+            "kth_neighbor_distance": _finite_or_nan(distances[:, -1], lambda d: np.percentile(d, 90)),
+            "neighbors_in_3_spacings": float(neighbours),
+            "extent": extent,
+            "max_extent": float(np.max(extent))}
+
+
+def suggest_parameters(stats, scale):
+    """
+    Scale aware values of the filter and reconstruction parameters, derived from compute_cloud_statistics.
+    Parameters whose statistics are not finite and positive are left out, so the current settings are kept.
+    The Poisson depth is chosen so that the octree leaves span a few point spacings, and at most
+    ceil(log4(n_points)) since the surface samples fill about 4^depth leaves;
+    it has no effect when a Poisson width is set. Ball pivoting is not included, reconstruct_ball_pivoting
+    already derives its radii from the point spacing.
+    """
+    suggested = {}
+    spacing = stats["spacing_median"]
+    if _is_positive(stats["kth_neighbor_distance"]):
+        suggested["radius"] = stats["kth_neighbor_distance"]
+    if _is_positive(stats["neighbors_in_3_spacings"]):
+        suggested["nb_neighbors"] = int(np.clip(stats["neighbors_in_3_spacings"], 10, 50))
+    if _is_positive(spacing):
+        suggested["alpha"] = 3 * spacing
+        leaves_per_side = scale * stats["max_extent"] / (POISSON_LEAF_SPACINGS * spacing)
+        if _is_positive(leaves_per_side):
+            depth_by_spacing = int(np.floor(np.log2(leaves_per_side)))
+            depth_by_points = int(np.ceil(np.log(stats["n_points"]) / np.log(4)))
+            depth = min(depth_by_spacing, depth_by_points)
+            suggested["depth"] = int(np.clip(depth, 5, 10))
+    return suggested
+
+
 def get_scene_pcd_from_camera():
     """
     This function captures the three-dimensional point cloud from the intel realsense camera.
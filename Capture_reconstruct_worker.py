@@ -0,0 +1,197 @@
+import multiprocessing as mp
+import time
+from multiprocessing import shared_memory
+
+import open3d as o3d
+import numpy as np
+
+from Capture_reconstruct_func import reconstrct_aplha_shapes, reconstrct_poisson_surface, reconstruct_ball_pivoting
+
+try:
+    import psutil
+except ImportError:  # optional, /proc is read directly on Linux
+    psutil = None
+
+"""
+Run the surface reconstruction algorithms in a separate worker process.
+The point cloud is handed to the worker through shared memory and the mesh comes back the same way.
+Every job runs with a wall-clock timeout and a memory ceiling on the resident memory of the worker,
+both enforced from the GUI process; a job exceeding either is killed, the GUI process and the captured
+point cloud are not affected.
+"""
+
+RECONSTRUCTION_METHODS = {
+    "alpha_shapes": reconstrct_aplha_shapes,
+    "poisson_surface": reconstrct_poisson_surface,
+    "ball_pivoting": reconstruct_ball_pivoting,
+}
+
+
+class ReconstructionError(RuntimeError):
+    """Raised when a reconstruction job fails, times out or runs out of memory"""
+
+
+def _arrays_to_shared_memory(arrays):
+    """Copy named numpy arrays to new shared memory blocks, return the blocks and their description"""
+    blocks, meta = [], {}
+    for name, array in arrays.items():
+        if not len(array):
+            continue
+        block = shared_memory.SharedMemory(create=True, size=array.nbytes)
+        np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[:] = array
+        blocks.append(block)
+        meta[name] = (block.name, array.shape, array.dtype.str)
+    return blocks, meta
+
+
+def _arrays_from_shared_memory(meta):
+    """Attach to the shared memory blocks of the description, return the blocks and numpy views on them"""
+    blocks, arrays = [], {}
+    for name, (block_name, shape, dtype) in meta.items():
+        block = shared_memory.SharedMemory(name=block_name)
+        blocks.append(block)
+        arrays[name] = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+    return blocks, arrays
+
+
+def _release(blocks, unlink=False):
+    for block in blocks:
+        block.close()
+        if unlink:
+            block.unlink()
+
+
+def _resident_memory_mb(pid):
+    """Resident memory of the process in MB, None if it cannot be read on this platform"""
+    try:
+        with open("/proc/{}/status".format(pid)) as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    if psutil is not None:
+        try:
+            return psutil.Process(pid).memory_info().rss / (1024 * 1024)
+        except psutil.Error:
+            pass
+    return None
+
+
+def _pcd_from_arrays(arrays):
+    pcd = o3d.geometry.PointCloud(o3d.utility.Vector3dVector(arrays["points"]))
+    if "normals" in arrays:
+        pcd.normals = o3d.utility.Vector3dVector(arrays["normals"])
+    if "colors" in arrays:
+        pcd.colors = o3d.utility.Vector3dVector(arrays["colors"])
+    return pcd
+
+
+def _mesh_from_arrays(arrays):
+    mesh = o3d.geometry.TriangleMesh()
+    if "vertices" in arrays:
+        mesh.vertices = o3d.utility.Vector3dVector(arrays["vertices"])
+    if "triangles" in arrays:
+        mesh.triangles = o3d.utility.Vector3iVector(arrays["triangles"])
+    if "vertex_normals" in arrays:
+        mesh.vertex_normals = o3d.utility.Vector3dVector(arrays["vertex_normals"])
+    if "vertex_colors" in arrays:
+        mesh.vertex_colors = o3d.utility.Vector3dVector(arrays["vertex_colors"])
+    return mesh
+
+
+def _copy_from_shared_memory(meta, to_geometry, unlink=False):
+    """Build an open3d geometry from the shared memory blocks of the description, then release the blocks"""
+    blocks, arrays = _arrays_from_shared_memory(meta)
+    geometry, error = None, None
+    try:
+        geometry = to_geometry(arrays)
+    except Exception as e:
+        # Keep only the message, the traceback would keep the numpy views alive
+        error = "{}: {}".format(type(e).__name__, e)
+    # The numpy views must be gone before the blocks can be closed
+    del arrays
+    _release(blocks, unlink)
+    if error is not None:
+        raise RuntimeError(error)
+    return geometry
+
+
+def _worker(conn, method, pcd_meta, params):
+    """Entry point of the worker process"""
+    result_blocks = []
+    try:
+        pcd = _copy_from_shared_memory(pcd_meta, _pcd_from_arrays)
+        result = RECONSTRUCTION_METHODS[method](pcd, **params)
+        extra, mesh = result if isinstance(result, tuple) else (None, result)
+        result_blocks, mesh_meta = _arrays_to_shared_memory({
+            "vertices": np.asarray(mesh.vertices),
+            "triangles": np.asarray(mesh.triangles),
+            "vertex_normals": np.asarray(mesh.vertex_normals),
+            "vertex_colors": np.asarray(mesh.vertex_colors)})
+        conn.send(("ok", mesh_meta, extra))
+        # Keep the blocks open until the GUI process has copied the mesh
+        conn.recv()
+    except Exception as e:
+        conn.send(("error", "{}: {}".format(type(e).__name__, e), None))
+    finally:
+        _release(result_blocks)
+        conn.close()
+
+
+def _stop(process):
+    process.terminate()
+    process.join(1)
+    if process.is_alive():
+        process.kill()
+        process.join()
+
+
+def run_reconstruction(method, pcd, params, timeout=120, memory_limit_mb=4096):
+    """
+    Run one of the RECONSTRUCTION_METHODS on the point cloud in a worker process.
+    Returns the same value as the reconstruction function, or raises ReconstructionError if the job
+    fails, takes longer than timeout seconds or its resident memory exceeds memory_limit_mb.
+    The memory limit is not enforced where the resident memory cannot be read (no /proc and no psutil).
+    """
+    if not pcd.has_points():
+        raise ReconstructionError("{} needs a point cloud with points".format(method))
+    blocks, pcd_meta = _arrays_to_shared_memory({
+        "points": np.asarray(pcd.points),
+        "normals": np.asarray(pcd.normals),
+        "colors": np.asarray(pcd.colors)})
+    ctx = mp.get_context("spawn")
+    conn, child_conn = ctx.Pipe()
+    process = ctx.Process(target=_worker, args=(child_conn, method, pcd_meta, params),
+                          daemon=True)
+    start = time.monotonic()
+    try:
+        process.start()
+        child_conn.close()
+        while not conn.poll(0.1):
+            if not process.is_alive():
+                raise ReconstructionError("{} worker died (exit code {})".format(
+                    method, process.exitcode))
+            if timeout and time.monotonic() - start > timeout:
+                raise ReconstructionError("{} did not finish within {} s".format(method, timeout))
+            memory_mb = _resident_memory_mb(process.pid)
+            if memory_limit_mb and memory_mb is not None and memory_mb > memory_limit_mb:
+                raise ReconstructionError("{} exceeded the memory limit of {} MB ({:.0f} MB in use)".format(
+                    method, memory_limit_mb, memory_mb))
+        try:
+            status, payload, extra = conn.recv()
+        except EOFError:
+            process.join(5)
+            raise ReconstructionError("{} worker died (exit code {})".format(
+                method, process.exitcode))
+        if status != "ok":
+            raise ReconstructionError("{} failed: {}".format(method, payload))
+        mesh = _copy_from_shared_memory(payload, _mesh_from_arrays, unlink=True)
+        conn.send("done")
+        process.join(timeout=5)
+    finally:
+        if process.is_alive():
+            _stop(process)
+        conn.close()
+        _release(blocks, unlink=True)
+    return mesh if extra is None else (extra, mesh)
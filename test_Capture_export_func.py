@@ -0,0 +1,67 @@
+import gzip
+import shutil
+
+import pytest
+
+np = pytest.importorskip("numpy")
+o3d = pytest.importorskip("open3d")
+
+from Capture_export_func import CHUNK_SIZE, export_geometry, next_numbered_path
+
+
+def _random_pcd(n_points):
+    rng = np.random.default_rng(0)
+    pcd = o3d.geometry.PointCloud(o3d.utility.Vector3dVector(rng.random((n_points, 3))))
+    normals = rng.random((n_points, 3))
+    pcd.normals = o3d.utility.Vector3dVector(normals / np.linalg.norm(normals, axis=1, keepdims=True))
+    # Colors exactly representable as uchar
+    pcd.colors = o3d.utility.Vector3dVector(rng.integers(0, 256, (n_points, 3)) / 255.0)
+    return pcd
+
+
+def _random_mesh(n_vertices, n_triangles):
+    pcd = _random_pcd(n_vertices)
+    mesh = o3d.geometry.TriangleMesh(pcd.points, o3d.utility.Vector3iVector(
+        np.random.default_rng(1).integers(0, n_vertices, (n_triangles, 3))))
+    mesh.vertex_normals = pcd.normals
+    mesh.vertex_colors = pcd.colors
+    return mesh
+
+
+def _decompressed(path, tmp_path):
+    if not path.endswith(".gz"):
+        return path
+    ply_path = str(tmp_path / "decompressed.ply")
+    with gzip.open(path, "rb") as src, open(ply_path, "wb") as dst:
+        shutil.copyfileobj(src, dst)
+    return ply_path
+
+
+@pytest.mark.parametrize("export_format,extension", [("Binary PLY", ".ply"), ("Compressed PLY", ".ply.gz")])
+@pytest.mark.parametrize("n_rows", [100, CHUNK_SIZE + 100])
+def test_point_cloud_round_trip(tmp_path, export_format, extension, n_rows):
+    pcd = _random_pcd(n_rows)
+    path = export_geometry(pcd, str(tmp_path / ("pcd" + extension)), export_format)
+    read = o3d.io.read_point_cloud(_decompressed(path, tmp_path))
+    np.testing.assert_allclose(np.asarray(read.points), np.asarray(pcd.points), atol=1e-6)
+    np.testing.assert_allclose(np.asarray(read.normals), np.asarray(pcd.normals), atol=1e-6)
+    np.testing.assert_allclose(np.asarray(read.colors), np.asarray(pcd.colors), atol=1e-6)
+
+
+@pytest.mark.parametrize("export_format,extension", [("Binary PLY", ".ply"), ("Compressed PLY", ".ply.gz")])
+@pytest.mark.parametrize("n_rows", [100, CHUNK_SIZE + 100])
+def test_mesh_round_trip(tmp_path, export_format, extension, n_rows):
+    mesh = _random_mesh(n_rows, n_rows + 50)
+    path = export_geometry(mesh, str(tmp_path / ("mesh" + extension)), export_format)
+    read = o3d.io.read_triangle_mesh(_decompressed(path, tmp_path))
+    np.testing.assert_allclose(np.asarray(read.vertices), np.asarray(mesh.vertices), atol=1e-6)
+    np.testing.assert_allclose(np.asarray(read.vertex_normals), np.asarray(mesh.vertex_normals), atol=1e-6)
+    np.testing.assert_allclose(np.asarray(read.vertex_colors), np.asarray(mesh.vertex_colors), atol=1e-6)
+    np.testing.assert_array_equal(np.asarray(read.triangles), np.asarray(mesh.triangles))
+
+
+def test_next_numbered_path(tmp_path):
+    first = next_numbered_path(str(tmp_path), "output_mesh", ".ply")
+    second = next_numbered_path(str(tmp_path), "output_mesh", ".ply")
+    assert first.endswith("output_mesh_0001.ply")
+    assert second.endswith("output_mesh_0002.ply")
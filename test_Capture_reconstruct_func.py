@@ -0,0 +1,29 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("open3d")
+pytest.importorskip("pyrealsense2")
+
+from Capture_reconstruct_func import suggest_parameters
+
+
+def _stats(n_points, spacing, max_extent):
+    return {"n_points": n_points, "spacing_median": spacing, "kth_neighbor_distance": 4 * spacing,
+            "neighbors_in_3_spacings": 28.0, "extent": np.array([max_extent] * 3), "max_extent": max_extent}
+
+
+def test_suggested_depth_for_realsense_capture():
+    # 640x480 capture: about 2 mm spacing over a 4.5 m scene
+    suggested = suggest_parameters(_stats(640 * 480, 0.002, 4.5), scale=1)
+    assert suggested["depth"] == 9
+
+
+def test_suggested_depth_capped_by_point_count():
+    suggested = suggest_parameters(_stats(1000, 0.002, 4.5), scale=1)
+    assert suggested["depth"] == 5
+
+
+def test_no_suggestions_from_invalid_statistics():
+    assert suggest_parameters(_stats(1, np.nan, 0.0) | {"kth_neighbor_distance": np.nan,
+                                                       "neighbors_in_3_spacings": np.nan}, scale=1) == {}
+    assert "alpha" not in suggest_parameters(_stats(100, 0.0, 1.0), scale=1)
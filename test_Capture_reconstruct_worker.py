@@ -0,0 +1,46 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+o3d = pytest.importorskip("open3d")
+pytest.importorskip("pyrealsense2")
+
+from Capture_reconstruct_worker import ReconstructionError, _arrays_to_shared_memory, _copy_from_shared_memory, \
+    _mesh_from_arrays, _release, run_reconstruction
+
+
+def _sphere_pcd():
+    return o3d.geometry.TriangleMesh.create_sphere(radius=1.0, resolution=20).sample_points_uniformly(2000)
+
+
+def test_shared_memory_round_trip():
+    rng = np.random.default_rng(0)
+    arrays = {"vertices": rng.random((500, 3)), "triangles": rng.integers(0, 500, (800, 3)).astype(np.int32),
+              "vertex_normals": rng.random((500, 3)), "vertex_colors": rng.random((500, 3))}
+    blocks, meta = _arrays_to_shared_memory(arrays)
+    try:
+        mesh = _copy_from_shared_memory(meta, _mesh_from_arrays)
+    finally:
+        _release(blocks, unlink=True)
+    np.testing.assert_array_equal(np.asarray(mesh.vertices), arrays["vertices"])
+    np.testing.assert_array_equal(np.asarray(mesh.triangles), arrays["triangles"])
+    np.testing.assert_array_equal(np.asarray(mesh.vertex_normals), arrays["vertex_normals"])
+    np.testing.assert_array_equal(np.asarray(mesh.vertex_colors), arrays["vertex_colors"])
+
+
+def test_copy_from_shared_memory_reports_errors():
+    blocks, meta = _arrays_to_shared_memory({"points": np.zeros((10, 3))})
+    try:
+        with pytest.raises(RuntimeError, match="KeyError"):
+            _copy_from_shared_memory(meta, lambda arrays: arrays["missing"])
+    finally:
+        _release(blocks, unlink=True)
+
+
+def test_run_reconstruction():
+    mesh = run_reconstruction("alpha_shapes", _sphere_pcd(), {"alpha": 0.5}, timeout=60, memory_limit_mb=None)
+    assert mesh.has_triangles()
+
+
+def test_run_reconstruction_reports_bad_parameters():
+    with pytest.raises(ReconstructionError, match="TypeError"):
+        run_reconstruction("alpha_shapes", _sphere_pcd(), {"radius": 0.5}, timeout=60, memory_limit_mb=None)